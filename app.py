@@ -1,5 +1,8 @@
-import time
 import os
+import sys
+import threading
+import contextlib
+import requests
 from data_manager import DataManager
 from flight_search import FlightSearch
 from notification_manager import NotificationManager
@@ -12,25 +15,50 @@ class App:
     This class is responsible for running the application.
     """
     _AUTO_UPDATE_INTERVAL = 120
+    _IDLE_UPDATE_INTERVAL = 3600
+    _MAX_BACKOFF = 8
+    _VALID_OPERATIONS = frozenset('1234567')
+    _CLEAR_SCREEN_SEQUENCE = '\x1b[2J\x1b[H'
+    _vt_enabled = os.name not in ('nt', 'dos')
 
     def __init__(self):
         self._logger = ProjectLogger().setup_main_logger()
         self._logger.debug('Initializing main app...')
-        self._data_manager = DataManager()
+        # Resources entered to the stack are closed when the application exits
+        self._stack = contextlib.ExitStack()
+        self._data_manager = self._stack.enter_context(DataManager())
         self._config = self._data_manager.get_config()
-        self._flight_search = FlightSearch(self._config['tequila_api_key'], self._config['CURRENCY'])
+        self._flight_search = self._stack.enter_context(
+            FlightSearch(self._config['tequila_api_key'], self._config['CURRENCY'])
+        )
         self._notification_manager = NotificationManager()
         self._update_all_loop = False
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._backoff = 1
         self._logger.debug('App initialized.')
 
+    def __enter__(self) -> 'App':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop()
+        self._stack.close()
+        self._logger.debug('App closed.')
+        ProjectLogger.shutdown()
+
     @staticmethod
     def _clear_screen() -> None:
         """
         This method clears the screen.
         :return: None
         """
-        command = 'cls' if os.name in ('nt', 'dos') else 'clear'
-        os.system(command)
+        if not App._vt_enabled:
+            # Running a shell command once enables ANSI escape sequences in Windows console
+            os.system('cls')
+            App._vt_enabled = True
+        sys.stdout.write(App._CLEAR_SCREEN_SEQUENCE)
+        sys.stdout.flush()
 
     @staticmethod
     def _press_enter() -> None:
@@ -50,7 +78,7 @@ class App:
             while True:
                 self._clear_screen()
                 operation = self._ask_for_operation()
-                self._logger.debug(f'Operation {operation} chosen.')
+                self._logger.debug('Operation %s chosen.', operation)
                 print('\n')
                 match operation:
                     case 1:
@@ -69,15 +97,13 @@ class App:
                         self._change_update_all_loop()
                     case 7:
                         self._logger.debug('Exiting...')
-                        exit(0)
+                        self._stop()
+                        return
                 print('\n')
                 self._press_enter()
         except KeyboardInterrupt:
             self._logger.debug('Exiting...')
-            del(self._data_manager)
-            del(self._flight_search)
-            del(self._notification_manager)
-            exit(0)
+            self._stop()
 
     def _add_new_flight(self) -> None:
         """
@@ -107,27 +133,49 @@ class App:
         else:
             print('Flight not found.')
 
-    def _update(self, send_notifications: bool = False) -> None:
+    @staticmethod
+    def _is_throttled(err: requests.exceptions.HTTPError) -> bool:
+        """
+        This method checks if search error means that the API asks to slow down.
+        :param err: requests.exceptions.HTTPError - error raised by the flight search
+        :return: bool - True if the API is rate limiting or failing (429/5xx), False otherwise
+        """
+        return err.response is not None and (err.response.status_code == 429 or err.response.status_code >= 500)
+
+    def _update(self, send_notifications: bool = False, only_stale: bool = False) -> bool:
         """
         This method updates all flights in database.
         :param send_notifications: bool - True if sms notifications should be sent, False otherwise
-        :return: None
+        :param only_stale: bool - True if recently updated flights should be skipped, False otherwise
+        :return: bool - False if the search API was rate limiting or failing, True otherwise
         """
         self._logger.debug('Updating flights...')
-        origin_airports = self._data_manager.get_start_locations()
-        for o_airport in origin_airports:
-            destination_airports = self._data_manager.get_destination_airports(o_airport)
-            for d_airport in destination_airports:
-                status_code = -1
-                self._logger.debug(f'Updating flight from {o_airport} to {d_airport}...')
-                search_data = self._flight_search.get_data_dict(o_airport, d_airport)
-                flight = self._flight_search.obtain_flight_data(search_data)
-                if flight:
-                    status_code = self._data_manager.update_flight(flight)
-                if status_code == 0 and send_notifications:
+        all_flights = self._data_manager.read_all_flights()
+        pairs = [(o_airport, d_airport) for o_airport, flights in all_flights.items() for d_airport in flights
+                 if not only_stale or self._data_manager.is_stale(o_airport, d_airport)]
+
+        queries = [self._flight_search.get_data_dict(o_airport, d_airport) for o_airport, d_airport in pairs]
+        results = self._flight_search.obtain_flight_data_many(queries)
+
+        api_ok = True
+        found_flights = []
+        for (o_airport, d_airport), result in zip(pairs, results):
+            if isinstance(result, Exception):
+                # Error is already logged by FlightSearch, skip this flight
+                if isinstance(result, requests.exceptions.HTTPError) and self._is_throttled(result):
+                    api_ok = False
+                continue
+            self._data_manager.mark_updated(o_airport, d_airport)
+            if result:
+                found_flights.append(result)
+
+        status_codes = self._data_manager.update_flights(found_flights)
+        if send_notifications:
+            for flight, status_code in zip(found_flights, status_codes):
+                if status_code == 0:
                     self._notification_manager.send_message(str(flight))
-                time.sleep(1)
         self._logger.debug('Flights updated.')
+        return api_ok
 
     def _print_origin_locations(self):
         """
@@ -145,7 +193,7 @@ class App:
         :param origin_airport: str - origin airport (IATA code)
         :return: None
         """
-        self._logger.debug(f'Printing destination locations for {origin_airport}...')
+        self._logger.debug('Printing destination locations for %s...', origin_airport)
         destination_airports = self._data_manager.get_destination_airports(origin_airport)
         print('Available destination airports:')
         print(", ".join(destination_airports))
@@ -156,15 +204,46 @@ class App:
         :return: None
         """
         self._update_all_loop = not self._update_all_loop
-        self._logger.info(f'Automatic data updates {"enabled" if self._update_all_loop else "disabled"}.')
+        # Wake up the automatic update thread, so the new status is applied immediately
+        self._wake_event.set()
+        self._logger.info('Automatic data updates %s.', 'enabled' if self._update_all_loop else 'disabled')
 
     def run_automatic_update(self) -> None:
-        while True:
+        """
+        This method runs automatic data updates until the application is stopped.
+        :return: None
+        """
+        while not self._stop_event.is_set():
             self._logger.debug('Automatic update tick.')
             if self._update_all_loop:
                 self._logger.debug('Automatic update loop on tick.')
-                self._update(send_notifications=True)
-            time.sleep(self._AUTO_UPDATE_INTERVAL)
+                try:
+                    if self._update(send_notifications=True, only_stale=True):
+                        self._backoff = 1
+                    else:
+                        self._backoff = min(self._backoff * 2, self._MAX_BACKOFF)
+                        self._logger.warning('Search API is limiting requests, next update in %sx interval.',
+                                             self._backoff)
+                except Exception as e:
+                    # Any other error (e.g. Sheets timeout or Twilio error) must not stop the update thread
+                    self._backoff = min(self._backoff * 2, self._MAX_BACKOFF)
+                    self._logger.error('Automatic update failed, next update in %sx interval. Error message: %s',
+                                       self._backoff, e)
+                interval = self._AUTO_UPDATE_INTERVAL * self._backoff
+            else:
+                interval = self._IDLE_UPDATE_INTERVAL
+            # Wait for the next tick, but wake up immediately when the status changes or the application stops
+            self._wake_event.wait(interval)
+            self._wake_event.clear()
+        self._logger.debug('Automatic updates stopped.')
+
+    def _stop(self) -> None:
+        """
+        This method stops automatic data updates.
+        :return: None
+        """
+        self._stop_event.set()
+        self._wake_event.set()
 
     def _ask_for_operation(self) -> int:
         """
@@ -189,11 +268,10 @@ class App:
         print('5. Get available destination airports for given start point.')
         print(f'6. Set up automatic data updates. (STATUS: {"ON" if self._update_all_loop else "OFF"})')
         print('7. Exit.')
-        operation = input('What do you want to do? -> ')
-        self._logger.debug(f'Operation chosen: {operation}')
-        if not operation or not operation.isdigit() or int(operation) not in range(1, 8):
+        while True:
+            operation = input('What do you want to do? -> ')
+            self._logger.debug('Operation chosen: %s', operation)
+            if operation in App._VALID_OPERATIONS:
+                return int(operation)
             print('You have to choose a number between 1 and 7.')
             self._logger.warning('User did not choose a proper number.')
-            return self._ask_for_operation()
-
-        return int(operation)
@@ -11,11 +11,20 @@
 
 import os
 import json
+import contextlib
+import time
+import functools
+import random
+import threading
+import httplib2
+from concurrent.futures import Future
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
 from log_module import ProjectLogger
 from flight_data import FlightData
 
@@ -28,6 +37,21 @@ class DataManager:
     API_SERVICE_NAME = "sheets"
     API_VERSION = "v4"
     AVAILABLE_RANGE = 'A:B'
+    HTTP_TIMEOUT = 30
+    # Retries with randomized exponential backoff for transient errors (429 and 5xx) of idempotent calls
+    API_RETRIES = 4
+    MIN_STALE_S = 6 * 60 * 60
+    FLIGHT_CACHE_TTL = 300
+    # Parsed config file shared by all instances (modification time, config dictionary)
+    _CONFIG_CACHE = None
+    # Google credentials, service and authorized HTTP connections shared by all instances,
+    # connections are kept per thread
+    _creds = None
+    _sheet_service = None
+    _init_lock = threading.Lock()
+    _local = threading.local()
+    _connections = []
+    _connections_lock = threading.Lock()
 
     def __init__(self):
         # create new logger for DataManager
@@ -35,19 +59,68 @@ class DataManager:
         self._config = self._check_if_config_folder_exists()
         self._logger.debug('Initializing DataManager...')
         self._spreadsheet_id = self._config['google_sheet_id']
-        self._handle_credentials()
-        try:
-            # Build the Google service
-            service = build(DataManager.API_SERVICE_NAME, DataManager.API_VERSION, credentials=self._creds)
-            # Call the Sheets API
-            self._sheet = service.spreadsheets()
-            self._logger.debug('Google Sheet service created')
-        except HttpError as err:
-            self._logger.error(err)
+        # Credentials and service are created once and shared, so other instances do not repeat the auth flow
+        with DataManager._init_lock:
+            self._handle_credentials()
+            if DataManager._sheet_service is None:
+                try:
+                    # Build the Google service
+                    service = build(DataManager.API_SERVICE_NAME, DataManager.API_VERSION, http=self._get_http(),
+                                    requestBuilder=self._build_request)
+                    # Call the Sheets API
+                    DataManager._sheet_service = service.spreadsheets()
+                    self._logger.debug('Google Sheet service created')
+                except HttpError as err:
+                    self._logger.error(err)
+            else:
+                self._logger.debug('Reusing Google Sheet service')
+        self._sheet = DataManager._sheet_service
+
+        # Cache of the sheet titles, loaded on first use, so existence checks do not call the API
+        self._sheet_titles = None
+
+        # Cache of flights data per start location {'startIataCode': {'iataCode1': lowestPrice1}}
+        self._flight_cache = {}
+        # Rows of the destinations per start location {'startIataCode': {'iataCode1': rowNumber1}}
+        self._row_index = {}
+        # Time the flights data was read per start location {'startIataCode': monotonic timestamp}
+        self._cache_ts = {}
+
+        # Reads in progress per start location, so concurrent cache misses share a single API call
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+
+        # Flights queued to be written in a single batch per thread (see begin_batch and commit_batch)
+        self._batch_queue = threading.local()
+        # Flights are written by the menu and the automatic update thread, so reads and writes of one update
+        # are not interleaved with the other thread
+        self._write_lock = threading.RLock()
+
+        # Time of the last search for each flight {('startIataCode', 'iataCode'): monotonic timestamp}
+        self._last_update_ts = {}
 
         self._logger.debug('DataManager initialized')
 
+    def __enter__(self) -> 'DataManager':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        This method closes all HTTP connections used by the Google service
+        :return: None
+        """
+        with DataManager._connections_lock:
+            for http in DataManager._connections:
+                http.http.close()
+            DataManager._connections.clear()
+        DataManager._local = threading.local()
+        self._logger.debug('DataManager connections closed')
+
     @staticmethod
+    @functools.lru_cache(maxsize=1024)
     def _prepare_range(sheet_id: str, cells: str) -> str:
         """
         This method prepares the range for the Google Sheet API
@@ -58,6 +131,7 @@ class DataManager:
         return f'\'{sheet_id}\'!{cells}'
 
     @staticmethod
+    @functools.lru_cache(maxsize=1024)
     def _prepare_sheet_id(start_location: str) -> str:
         """
         This method prepares the sheet id for the Google Sheet API
@@ -66,6 +140,16 @@ class DataManager:
         """
         return f'FROM_{start_location}'
 
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def _prepare_flights_range(start_location: str) -> str:
+        """
+        This method prepares the range of all flights data of the start location for the Google Sheet API
+        :param start_location: start location IATA code
+        :return: Range e.g. 'FROM_GDA'!A:B
+        """
+        return DataManager._prepare_range(DataManager._prepare_sheet_id(start_location), DataManager.AVAILABLE_RANGE)
+
     @staticmethod
     def get_flight_dict(start_location: str, destination: str, price: int) -> dict:
         """
@@ -77,37 +161,70 @@ class DataManager:
         """
         return {'origin_airport': start_location, 'destination_airport': destination, 'price': price}
 
+    def _get_http(self) -> AuthorizedHttp:
+        """
+        This method returns the authorized HTTP connection of the current thread.
+        httplib2 is not thread safe, so every thread gets its own connection, kept alive between requests.
+        :return: authorized HTTP connection
+        """
+        http = getattr(DataManager._local, 'http', None)
+        if http is None:
+            http = AuthorizedHttp(DataManager._creds, http=httplib2.Http(timeout=DataManager.HTTP_TIMEOUT))
+            DataManager._local.http = http
+            with DataManager._connections_lock:
+                DataManager._connections.append(http)
+            self._logger.debug('New authorized HTTP connection created')
+        return http
+
+    def _build_request(self, http: AuthorizedHttp, *args, **kwargs) -> HttpRequest:
+        """
+        This method builds the Google API request using the HTTP connection of the current thread
+        :param http: HTTP connection the service was built with (ignored)
+        :return: request ready to be executed
+        """
+        return HttpRequest(self._get_http(), *args, **kwargs)
+
     def _handle_credentials(self) -> None:
         """
         This method handles the Google credentials for the application.
-        It checks if the token file exists, if it does, it loads the credentials from file.
+        Credentials already loaded by another instance are reused.
+        Otherwise, it checks if the token file exists, if it does, it loads the credentials from file.
         If there are no credentials, it creates new ones.
         :return: None
         """
-        # Check if token file exists, if it does, load credentials from file
-        if os.path.exists(self._config['google_token_file']):
-            self._creds = Credentials.from_authorized_user_file(self._config['google_token_file'],
-                                                                DataManager.API_SCOPES)
+        creds = DataManager._creds
+        if creds and creds.valid:
+            self._logger.debug('Reusing Google credentials')
+            return
+
+        # Check if token file exists (it is created empty on first run), if it does, load credentials from file
+        token_file = self._config['google_token_file']
+        if creds is None and os.path.exists(token_file) and os.path.getsize(token_file) > 0:
+            creds = Credentials.from_authorized_user_file(token_file, DataManager.API_SCOPES)
             self._logger.debug('Google credentials loaded from file')
 
         # If there are no (valid) credentials available, let the user log in using OAuth.
-        if not self._creds or not self._creds.valid:
-            if self._creds and self._creds.expired and self._creds.refresh_token:
+        if not creds or not creds.valid:
+            if creds and creds.expired and creds.refresh_token:
                 # If credentials are expired, but refresh token is available, refresh credentials
                 self._logger.debug('Credentials expired, refreshing...')
-                self._creds.refresh(Request())
+                creds.refresh(Request())
                 self._logger.debug('Credentials refreshed')
             else:
                 # If credentials are not available, create new credentials
                 self._logger.debug('Credentials not available, creating new...')
                 flow = InstalledAppFlow.from_client_secrets_file(self._config['google_credentials_file'],
                                                                  DataManager.API_SCOPES)
-                self._creds = flow.run_local_server(port=0)
+                creds = flow.run_local_server(port=0)
                 self._logger.debug('Credentials created')
-            # Save the credentials for the next run
-            with open(self._config['google_token_file'], 'w+') as token:
-                token.write(self._creds.to_json())
-                self._logger.debug('Credentials saved to file')
+            # Save the credentials for the next run, written to a temporary file first, so the swap is atomic
+            tmp_token_file = f'{token_file}.tmp'
+            with open(tmp_token_file, 'w') as token:
+                token.write(creds.to_json())
+            os.replace(tmp_token_file, token_file)
+            self._logger.debug('Credentials saved to file')
+
+        DataManager._creds = creds
 
     def _check_if_config_folder_exists(self) -> dict:
         """
@@ -129,11 +246,10 @@ class DataManager:
             self._logger.warning('Config file does not exist, creating...')
 
             with open('.config/config.json', 'w+') as f:
-                f.write(json.dumps(config))
+                json.dump(config, f)
 
         else:
-            with open('.config/config.json', 'r') as f:
-                config = json.load(f)
+            config = self._load_config('.config/config.json')
 
         if not os.path.exists(config['google_token_file']):
             self._logger.warning('Google token file does not exist, creating...')
@@ -149,6 +265,23 @@ class DataManager:
 
         return config
 
+    @staticmethod
+    def _load_config(config_file: str) -> dict:
+        """
+        This method loads the config file. The file is parsed again only if it was modified since the last load.
+        :param config_file: path to the config file
+        :return: config dictionary
+        """
+        mtime = os.stat(config_file).st_mtime_ns
+        if DataManager._CONFIG_CACHE is not None and DataManager._CONFIG_CACHE[0] == mtime:
+            return DataManager._CONFIG_CACHE[1]
+
+        with open(config_file, 'r') as f:
+            config = json.load(f)
+
+        DataManager._CONFIG_CACHE = (mtime, config)
+        return config
+
     def get_config(self) -> dict:
         """
         This method returns the json setup for the application
@@ -156,83 +289,122 @@ class DataManager:
         """
         return self._config
 
-    def _create_sheet(self, sheet_id: str) -> bool:
+    @staticmethod
+    def _prepare_cell(value) -> dict:
+        """
+        This method prepares the cell data for the Google Sheet API
+        :param value: value of the cell e.g. 'WAW' or 123
+        :return: Cell data e.g. {'userEnteredValue': {'numberValue': 123}}
+        """
+        if isinstance(value, (int, float)):
+            return {'userEnteredValue': {'numberValue': value}}
+        return {'userEnteredValue': {'stringValue': str(value)}}
+
+    def _create_sheet(self, sheet_id: str, initial_values: list = None) -> bool:
         """
         This method creates the sheet in the connected Google spreadsheet
         :param sheet_id: Sheet id to be created e.g. 'Sheet1'
+        :param initial_values: 2D list of values written to the new sheet in the same request e.g. [['WAW', 123]]
         :return: True if sheet was created, False otherwise
         """
         status = False
 
-        self._logger.debug(f'Creating sheet {sheet_id}')
+        self._logger.debug('Creating sheet %s', sheet_id)
+
+        # Numeric id of the new sheet is chosen upfront, so the initial rows can refer to it.
+        # It is random, so a renamed sheet created earlier with the same title does not block it
+        numeric_id = random.randrange(1, 2 ** 31)
+        requests = [
+            {
+                'addSheet': {
+                    'properties': {
+                        'title': sheet_id,
+                        'sheetId': numeric_id
+                    }
+                }
+            }
+        ]
+        if initial_values:
+            requests.append({
+                'appendCells': {
+                    'sheetId': numeric_id,
+                    'rows': [{'values': [self._prepare_cell(value) for value in row]} for row in initial_values],
+                    'fields': 'userEnteredValue'
+                }
+            })
 
         try:
             # Call the Sheets API to create the sheet
-            self._logger.debug(f'Calling Sheets API to create sheet {sheet_id}')
-            self._sheet.batchUpdate(spreadsheetId=self._spreadsheet_id, body={
-                'requests': [
-                    {
-                        'addSheet': {
-                            'properties': {
-                                'title': sheet_id
-                            }
-                        }
-                    }
-                ]
-            }).execute()
+            self._logger.debug('Calling Sheets API to create sheet %s', sheet_id)
+            self._sheet.batchUpdate(spreadsheetId=self._spreadsheet_id, body={'requests': requests}).execute()
+            if self._sheet_titles is not None:
+                self._sheet_titles.add(sheet_id)
             status = True
         except HttpError as err:
             self._logger.error(err)
 
         return status
 
+    def refresh_titles(self) -> None:
+        """
+        This method refreshes the cached sheet titles of the connected Google spreadsheet.
+        It should be called if sheets were added or removed outside the application.
+        :return: None
+        """
+        try:
+            # Call the Sheets API to get only the titles of the sheets
+            self._logger.debug('Calling Sheets API to get the sheet titles')
+            result = self._sheet.get(spreadsheetId=self._spreadsheet_id,
+                                     fields='sheets.properties.title').execute(num_retries=DataManager.API_RETRIES)
+            self._sheet_titles = {sheet['properties']['title'] for sheet in result.get('sheets', [])}
+            self._logger.debug('%s sheet titles cached', len(self._sheet_titles))
+        except HttpError as err:
+            self._logger.error(err)
+
     def _check_if_sheet_exists(self, sheet_id: str) -> bool:
         """
         This method checks if the sheet exists in the connected Google spreadsheet
         :param sheet_id: Sheet id to be checked e.g. 'Sheet1'
         :return: True if a sheet exists, False otherwise
         """
-        status = False
-
-        self._logger.debug(f'Checking if sheet {sheet_id} exists')
-
-        # Call the Sheets API to get the list of sheets
-        sheets = self.get_start_locations()
+        self._logger.debug('Checking if sheet %s exists', sheet_id)
 
-        # Check if sheet exists
-        for sheet in sheets:
-            if f'FROM_{sheet}' == sheet_id:
-                status = True
-                break
+        # Load the titles if they were not loaded yet (or loading failed before)
+        if self._sheet_titles is None:
+            self.refresh_titles()
 
-        return status
+        return self._sheet_titles is not None and sheet_id in self._sheet_titles
 
-    def _append_data(self, sheet_id: str, new_values: list) -> bool:
+    def _append_data(self, sheet_id: str, new_values: list) -> int:
         """
         This method appends the data to the connected Google spreadsheet
         :param sheet_id: Sheet id to be updated e.g. 'Sheet1'
         :param new_values: 2D list of values to append e.g. [['New Value A', 'New Value B'], ['New Value C', 'New Value D']]
-        :return: True if append was successful, False otherwise
+        :return: number of the first appended row (starting from 1) or 0 if append was not successful
         """
-        status = False
+        first_row = 0
 
-        self._logger.debug(f'Appending values {new_values} to sheet {sheet_id}')
+        self._logger.debug('Appending %s rows to sheet %s', len(new_values), sheet_id)
 
         # Add sheet id to the range, so it looks like 'Sheet1!A1:B2'
         data_range = self._prepare_range(sheet_id, DataManager.AVAILABLE_RANGE)
 
-        self._logger.debug(f'Calling Sheets API to append data to {data_range}')
+        self._logger.debug('Calling Sheets API to append data to %s', data_range)
 
         try:
             # Call the Sheets API to append the data
-            self._sheet.values().append(spreadsheetId=self._spreadsheet_id, range=data_range,
-                                        valueInputOption='USER_ENTERED', insertDataOption='INSERT_ROWS',
-                                        body={'values': new_values}).execute()
-            status = True
+            result = self._sheet.values().append(spreadsheetId=self._spreadsheet_id, range=data_range,
+                                                 valueInputOption='RAW', insertDataOption='INSERT_ROWS',
+                                                 body={'values': new_values}).execute()
+            # Appended rows are reported as e.g. 'Sheet1'!A4:B5, so the first row does not have to be guessed
+            updated_range = result['updates']['updatedRange']
+            first_cell = updated_range.rsplit('!', 1)[1].split(':')[0]
+            first_row = int(first_cell.lstrip('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+            self._logger.debug('Data appended to %s', updated_range)
         except HttpError as err:
             self._logger.error(err)
 
-        return status
+        return first_row
 
     def _update_data(self, new_values: list, cells_range: str) -> bool:
         """
@@ -242,28 +414,54 @@ class DataManager:
         :return: True if update was successful, False otherwise
         """
         status = False
-        self._logger.debug(f'Updating range `{cells_range}` with values {new_values}')
+        self._logger.debug('Updating range `%s` with values %s', cells_range, new_values)
         try:
             # Call the Sheets API to update the data
             result = self._sheet.values().update(spreadsheetId=self._spreadsheet_id, range=cells_range,
-                                                 valueInputOption='RAW',
-                                                 body={'values': new_values}).execute()
+                                                 valueInputOption='RAW', body={'values': new_values}
+                                                 ).execute(num_retries=DataManager.API_RETRIES)
             # Check if any cells were updated
             status = result.get('updatedCells') > 0
             if status:
-                self._logger.debug(f'{result.get("updatedCells")} cells updated')
+                self._logger.debug('%s cells updated', result.get("updatedCells"))
+            else:
+                self._logger.debug('No cells updated')
+        except HttpError as err:
+            self._logger.error(err)
+
+        return status
+
+    def _batch_update_data(self, data: list) -> bool:
+        """
+        This method updates multiple ranges in the connected Google spreadsheet with a single request
+        :param data: list of value ranges [{'range': 'My Custom Sheet!B1', 'values': [['New Value']]}, ...]
+        :return: True if update was successful, False otherwise
+        """
+        status = False
+        self._logger.debug('Batch updating %s ranges', len(data))
+        try:
+            # Call the Sheets API to update all ranges at once
+            result = self._sheet.values().batchUpdate(spreadsheetId=self._spreadsheet_id, body={
+                'valueInputOption': 'RAW',
+                'data': data
+            }).execute(num_retries=DataManager.API_RETRIES)
+            # Check if any cells were updated
+            status = result.get('totalUpdatedCells', 0) > 0
+            if status:
+                self._logger.debug('%s cells updated', result.get("totalUpdatedCells"))
             else:
-                self._logger.debug(f'No cells updated')
+                self._logger.debug('No cells updated')
         except HttpError as err:
             self._logger.error(err)
 
         return status
 
-    def _read_data(self, cells_range: str = None) -> list:
+    def _read_data(self, cells_range: str = None) -> list | None:
         """
         This method reads the data from the connected Google spreadsheet
         :param cells_range: Range to read in Sheet!A1:B2 format e.g. 'My Custom Sheet!A1:B2'
-        :return: 2D list of values [['Value A', 'Value B'], ['Value C', 'Value D']]
+        :return: 2D list of values [['Value A', 'Value B'], ['Value C', 'Value D']],
+        empty list if the sheet does not exist or None if the data could not be read
         """
         # Check if range is specified
         if cells_range is None:
@@ -273,18 +471,20 @@ class DataManager:
         try:
             # Call the Sheets API to read the data
             self._logger.debug('Calling Sheets API to access data')
-
-            # Check if sheet exists
-            sheet_id = cells_range.split("!")[0].replace('\'', '')
-            if not self._check_if_sheet_exists(sheet_id):
-                self._logger.error(f'Sheet `{sheet_id}` does not exist')
-                return []
-
-            result = self._sheet.values().get(spreadsheetId=self._spreadsheet_id, range=cells_range).execute()
+            # Request only the raw values, so the response is small and numbers are not formatted as strings
+            result = self._sheet.values().get(spreadsheetId=self._spreadsheet_id, range=cells_range,
+                                              majorDimension='ROWS', valueRenderOption='UNFORMATTED_VALUE',
+                                              fields='values').execute(num_retries=DataManager.API_RETRIES)
             values = result.get('values', [])
         except HttpError as err:
-            self._logger.error(err)
-            values = []
+            # Sheets API responds with 400 if the range refers to a sheet that does not exist
+            if err.resp.status == 400:
+                sheet_id = cells_range.split("!")[0].replace('\'', '')
+                self._logger.error('Sheet `%s` does not exist', sheet_id)
+                values = []
+            else:
+                self._logger.error(err)
+                values = None
         return values
 
     def _get_flights_amount(self, start_location: str) -> int:
@@ -293,38 +493,168 @@ class DataManager:
         :param start_location: start location IATA code
         :return: amount of flights
         """
-        self._logger.debug(f'Reading flights amount for {start_location}...')
-        # Call the Sheets API to read the data
-        sheet_id = self._prepare_sheet_id(start_location)
-        read_range = self._prepare_range(sheet_id, DataManager.AVAILABLE_RANGE)
-        flights = self._read_flights(read_range)
+        self._logger.debug('Reading flights amount for %s...', start_location)
+        # Read the cached data, the Sheets API is called only if start location is not cached yet
+        flights = self._read_flights(start_location) or {}
 
         # Return amount of flights
-        self._logger.debug(f'Amount of flights for {start_location}: {len(flights)}')
+        self._logger.debug('Amount of flights for %s: %s', start_location, len(flights))
 
         return len(flights)
 
-    def _read_flights(self, start_location: str) -> dict:
+    def _read_flights(self, start_location: str) -> dict | None:
         """
-        This method reads all flights data from the connected Google spreadsheet
+        This method reads all flights data from the connected Google spreadsheet.
+        Data is read from the cache if it was already read for given start location.
         :param start_location: start location IATA code
         :return: dictionary of flights data {'iataCode1': 'lowestPrice1', 'iataCode2': 'lowestPrice2'}
+        or None if the data could not be read
         """
-        self._logger.debug(f'Reading flights data...')
-        # Call the Sheets API to read the data
-        sheet_id = self._prepare_sheet_id(start_location)
-        read_range = self._prepare_range(sheet_id, DataManager.AVAILABLE_RANGE)
-        values = self._read_data(read_range)
+        with self._inflight_lock:
+            if self._is_cached(start_location):
+                self._logger.debug('Using cached flights data for %s', start_location)
+                return self._flight_cache[start_location]
+
+            # Check if the same data is already being read by another thread
+            future = self._inflight.get(start_location)
+            is_reader = future is None
+            if is_reader:
+                future = Future()
+                self._inflight[start_location] = future
+
+        if not is_reader:
+            self._logger.debug('Waiting for flights data of %s read in progress', start_location)
+            return future.result()
 
-        self._logger.debug(f'Collected all flights data')
+        try:
+            self._logger.debug('Reading flights data...')
+            # Call the Sheets API to read the data
+            read_range = self._prepare_flights_range(start_location)
+            values = self._read_data(read_range)
+
+            # Failed read is not cached, so it is not mistaken for a sheet without flights
+            if values is None:
+                self._logger.error('Flights data for %s could not be read', start_location)
+                flights = None
+            else:
+                self._logger.debug('Collected all flights data: %s rows', len(values))
+                # Return dictionary of flight data {'iataCode1': 'lowestPrice1', 'iataCode2': 'lowestPrice2'}
+                flights = self._cache_flights(start_location, values)
+            future.set_result(flights)
+        except Exception as err:
+            future.set_exception(err)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(start_location, None)
 
-        self._logger.debug(values)
+        return flights
 
-        # Return dictionary of flight data {'iataCode1': 'lowestPrice1', 'iataCode2': 'lowestPrice2'}
-        flights = {f'{row[0]}': int(row[1]) for row in values if len(row) == 2}
+    @staticmethod
+    def _parse_flights(values: list) -> dict:
+        """
+        This method parses the raw sheet values into flights data
+        :param values: 2D list of values [['iataCode1', 'lowestPrice1'], ['iataCode2', 'lowestPrice2']]
+        :return: dictionary of flights data {'iataCode1': lowestPrice1, 'iataCode2': lowestPrice2}
+        """
+        # Values are read unformatted, so prices are already numbers
+        return dict(row for row in values if len(row) == 2)
 
+    def _cache_flights(self, start_location: str, values: list) -> dict:
+        """
+        This method parses the raw sheet values and stores them with their row numbers in the cache
+        :param start_location: start location IATA code
+        :param values: 2D list of values [['iataCode1', 'lowestPrice1'], ['iataCode2', 'lowestPrice2']]
+        :return: dictionary of flights data {'iataCode1': lowestPrice1, 'iataCode2': lowestPrice2}
+        """
+        flights = self._parse_flights(values)
+        self._flight_cache[start_location] = flights
+        self._row_index[start_location] = {row[0]: nr + 1 for nr, row in enumerate(values) if len(row) == 2}
+        self._cache_ts[start_location] = time.monotonic()
         return flights
 
+    def _is_cached(self, start_location: str) -> bool:
+        """
+        This method checks if flights data of given start location is cached and not older than FLIGHT_CACHE_TTL
+        :param start_location: start location IATA code
+        :return: True if cached data can be used, False otherwise
+        """
+        cached_at = self._cache_ts.get(start_location)
+        return cached_at is not None and time.monotonic() - cached_at < DataManager.FLIGHT_CACHE_TTL
+
+    def _cache_new_flight(self, flight: FlightData, row_number: int) -> None:
+        """
+        This method adds the flight appended to the start location sheet to the cache
+        :param flight: See FlightData class for more information.
+        :param row_number: row number (starting from 1) the flight was written to
+        :return: None
+        """
+        if flight.origin_airport not in self._flight_cache:
+            return
+        self._row_index[flight.origin_airport][flight.destination_airport] = row_number
+        self._flight_cache[flight.origin_airport][flight.destination_airport] = flight.price
+
+    def read_all_flights(self) -> dict:
+        """
+        This method reads flights data for all start locations with a single batch request
+        :return: dictionary of flights data {'startIataCode': {'iataCode1': lowestPrice1, 'iataCode2': lowestPrice2}}
+        """
+        self._logger.debug('Reading flights data for all start locations...')
+        # Refresh the cached titles once per full read
+        self.refresh_titles()
+        start_locations = [title.replace('FROM_', '') for title in sorted(self._sheet_titles or ())
+                           if title.startswith('FROM_')]
+        if not start_locations:
+            self._logger.debug('No start locations found')
+            return {}
+
+        all_flights = self._read_flights_batch(start_locations)
+
+        self._logger.debug('Collected flights data for %s start locations', len(all_flights))
+
+        return all_flights
+
+    def _read_flights_batch(self, start_locations: list) -> dict:
+        """
+        This method reads flights data of given start locations with a single batch request and caches it
+        :param start_locations: list of start locations IATA codes, their sheets have to exist
+        :return: dictionary of flights data {'startIataCode': {'iataCode1': lowestPrice1, 'iataCode2': lowestPrice2}}
+        """
+        if not start_locations:
+            return {}
+
+        try:
+            # Call the Sheets API to read all sheets in one request
+            ranges = [self._prepare_flights_range(start_location) for start_location in start_locations]
+            self._logger.debug('Calling Sheets API to batch read %s ranges', len(ranges))
+            result = self._sheet.values().batchGet(spreadsheetId=self._spreadsheet_id, ranges=ranges,
+                                                   majorDimension='ROWS', valueRenderOption='UNFORMATTED_VALUE',
+                                                   fields='valueRanges(values)'
+                                                   ).execute(num_retries=DataManager.API_RETRIES)
+            value_ranges = result.get('valueRanges', [])
+        except HttpError as err:
+            self._logger.error(err)
+            return {}
+
+        # Value ranges are returned in the same order as the requested ranges
+        return {
+            start_location: self._cache_flights(start_location, value_range.get('values', []))
+            for start_location, value_range in zip(start_locations, value_ranges)
+        }
+
+    def _get_row_number(self, start_location: str, destination: str) -> int:
+        """
+        This method finds the row number of given destination in the start location sheet
+        :param start_location: start location IATA code
+        :param destination: destination IATA code
+        :return: row number (starting from 1) or -1 if there is no data for given destination
+        """
+        # Make sure the start location is cached
+        if self._read_flights(start_location) is None:
+            return -1
+
+        return self._row_index.get(start_location, {}).get(destination, -1)
+
     def _add_flight(self, flight: FlightData) -> None:
         """
         This method adds the new flight data to the connected Google spreadsheet
@@ -332,7 +662,8 @@ class DataManager:
         :return: True if data added, False otherwise
         """
         self._logger.debug(
-            f'Adding flight data: {flight.origin_airport}->{flight.destination_airport} with price {flight.price}$'
+            'Adding flight data: %s->%s with price %s$',
+            flight.origin_airport, flight.destination_airport, flight.price
         )
 
         # Check if there is data to add
@@ -340,35 +671,56 @@ class DataManager:
             self._logger.error('add_flight: No data to add')
             return
 
-        # Check if sheet exists
-        sheet_id = self._prepare_sheet_id(flight.origin_airport)
-        if not self._check_if_sheet_exists(sheet_id):
-            self._create_sheet(sheet_id)
-
-        # Call the Sheets API to add the data
-        status = self._append_data(sheet_id, [[flight.destination_airport, flight.price]])
+        if self._add_flights(flight.origin_airport, [flight]):
+            self._logger.debug('Flight data added')
+        else:
+            self._logger.error('Flight data not added')
 
-        if status:
-            self._logger.debug(f'Flight data added')
+    def _add_flights(self, start_location: str, flights: list) -> bool:
+        """
+        This method adds new flights of one start location to the connected Google spreadsheet.
+        If there is no sheet for the start location yet, it is created together with the flights in one request.
+        :param start_location: start location IATA code
+        :param flights: list of FlightData objects with given start location
+        :return: True if flights were added, False otherwise
+        """
+        sheet_id = self._prepare_sheet_id(start_location)
+        new_values = [[flight.destination_airport, flight.price] for flight in flights]
+
+        if self._check_if_sheet_exists(sheet_id):
+            # Call the Sheets API to add the data
+            first_row = self._append_data(sheet_id, new_values)
+        elif self._create_sheet(sheet_id, new_values):
+            # New sheet contains only the added flights, starting from the first row
+            self._cache_flights(start_location, [])
+            first_row = 1
         else:
-            self._logger.error(f'Flight data not added')
+            # Cached titles may be outdated (e.g. sheet added outside the application), so try to append anyway
+            self._logger.debug('Sheet %s not created, refreshing titles and appending', sheet_id)
+            self.refresh_titles()
+            first_row = self._append_data(sheet_id, new_values)
+
+        if first_row:
+            if first_row <= max(self._row_index.get(start_location, {}).values(), default=0):
+                # Rows were inserted above cached flights (the table ends at the first blank row),
+                # so the cached row numbers moved and the start location has to be read again
+                self._logger.debug('Rows inserted inside cached data of %s, dropping the cache', start_location)
+                self._cache_ts.pop(start_location, None)
+            else:
+                for row_number, flight in enumerate(flights, start=first_row):
+                    self._cache_new_flight(flight, row_number)
+
+        return first_row > 0
 
     def get_start_locations(self) -> list:
         """
         This method reads all start_locations from the connected Google spreadsheet
         :return: list of start locations IATA codes
         """
-        # Call the Sheets API to get the list of sheets
-        try:
-            self._logger.debug(f'Calling Sheets API to get the list of sheets')
-            result = self._sheet.get(spreadsheetId=self._spreadsheet_id).execute()
-            sheets = result.get('sheets', [])
-            self._logger.debug(f'{len(sheets)} sheets found')
-        except HttpError as err:
-            self._logger.error(err)
-            sheets = []
+        # Refresh the cached sheet titles, so sheets added outside the application are listed too
+        self.refresh_titles()
 
-        return [sheet['properties']['title'].replace('FROM_', '') for sheet in sheets]
+        return [title.replace('FROM_', '') for title in sorted(self._sheet_titles or ())]
 
     def get_destination_airports(self, start_location: str) -> list:
         """
@@ -376,15 +728,14 @@ class DataManager:
         :param start_location: start location IATA code
         :return: list of destinations IATA codes
         """
-        self._logger.debug(f'Reading destinations for {start_location}...')
+        self._logger.debug('Reading destinations for %s...', start_location)
         # Call the Sheets API to read the data
-        sheet_id = self._prepare_sheet_id(start_location)
-        read_range = self._prepare_range(sheet_id, DataManager.AVAILABLE_RANGE)
-        values = self._read_data(read_range)
+        read_range = self._prepare_flights_range(start_location)
+        values = self._read_data(read_range) or []
         destinations = [row[0] for row in values]
 
         # Return list of destinations
-        self._logger.debug(f'Destinations for {start_location}: {destinations}')
+        self._logger.debug('Destinations for %s: %s', start_location, destinations)
         return destinations
 
     def get_flight_data(self, data: FlightData) -> dict:
@@ -396,8 +747,13 @@ class DataManager:
         """
         flights = self._read_flights(start_location=data.origin_airport)
 
+        if flights is None:
+            self._logger.error('Flight data for %s->%s could not be read',
+                               data.origin_airport, data.destination_airport)
+            return {}
+
         if data.destination_airport not in flights.keys():
-            self._logger.error(f'No flight data found for {data.origin_airport}->{data.destination_airport}')
+            self._logger.error('No flight data found for %s->%s', data.origin_airport, data.destination_airport)
             return {}
 
         return flights.get(data.destination_airport)
@@ -412,40 +768,272 @@ class DataManager:
         status = False
 
         self._logger.info(
-            f'Updating flight data: {flight.origin_airport}->{flight.destination_airport} with price {flight.price}'
+            'Updating flight data: %s->%s with price %s',
+            flight.origin_airport, flight.destination_airport, flight.price
         )
 
-        # Check if start location exists in the sheet
-        if not self._check_if_sheet_exists(self._prepare_sheet_id(flight.origin_airport)):
-            self._logger.debug(
-                f'update_flight: There is no sheet for iata code `{flight.origin_airport}`, creating new')
-            self._add_flight(flight)
-            return 0
+        # Flights are also updated by the automatic update thread, so writes must not interleave
+        with self._write_lock:
+            # Check if start location exists in the sheet
+            if not self._check_if_sheet_exists(self._prepare_sheet_id(flight.origin_airport)):
+                self._logger.debug(
+                    'update_flight: There is no sheet for iata code `%s`, creating new', flight.origin_airport)
+                self._add_flight(flight)
+                return 0
+
+            # Get existing price from the cached flights of the start location
+            flights = self._read_flights(flight.origin_airport)
+            if flights is None:
+                self._logger.error('update_flight: Flights data for `%s` could not be read, not updating...',
+                                   flight.origin_airport)
+                return 1
+            existing_price = flights.get(flight.destination_airport)
+
+            # Add new data if there is no data for this destination
+            if existing_price is None:
+                self._logger.debug('update_flight: No data for iata code `%s`', flight.destination_airport)
+                self._add_flight(flight)
+                return 0
+
+            # Skip the API call if the price did not change
+            if flight.price == existing_price:
+                self._logger.debug('update_flight: Price unchanged, skipping...')
+                return 1
+
+            # Check if price is lower than existing one
+            if flight.price < existing_price:
+                self._logger.debug('update_flight: New price is lower than existing one, updating...')
+                # Row index may have been replaced by another thread's read, so the row is looked up safely
+                row_number = self._get_row_number(flight.origin_airport, flight.destination_airport)
+                if row_number == -1:
+                    self._logger.error('update_flight: Row of `%s` not found, not updating...',
+                                       flight.destination_airport)
+                    return 1
+                # Call the Sheets API to update the data
+                update_range = self._prepare_range(self._prepare_sheet_id(flight.origin_airport), f'B{row_number}')
+                status = self._update_data([[flight.price]], update_range)
+                if status:
+                    self._flight_cache[flight.origin_airport][flight.destination_airport] = flight.price
+            else:
+                self._logger.debug('update_flight: New price is higher than existing one, not updating...')
 
-        # Get range to update
-        row_number = -1
-        existing_values = self._read_flights(flight.origin_airport)
-        for nr, row in enumerate(existing_values.keys()):
-            if row == flight.destination_airport:
-                self._logger.debug(f'Found existing entry for `{flight.destination_airport}`')
-                row_number = nr + 1
-                break
+            return 0 if status else 1
+
+    def begin_batch(self) -> None:
+        """
+        This method starts a new batch of flight updates. Queued flights are written by commit_batch.
+        :return: None
+        """
+        self._logger.debug('Starting new batch of flight updates')
+        self._batch_queue.updates = []
+        self._batch_queue.appends = []
+
+    def _get_batch_queue(self) -> tuple:
+        """
+        This method returns the flights queued by the current thread
+        :return: tuple of lists (flights to update, flights to append)
+        """
+        if not hasattr(self._batch_queue, 'updates'):
+            self.begin_batch()
+        return self._batch_queue.updates, self._batch_queue.appends
+
+    def queue_update(self, flight: FlightData) -> int:
+        """
+        This method queues the flight data update, which is written to the connected Google sheet by commit_batch
+        :param flight: See FlightData class for more information.
+        :return: status code (0 - queued with lower price or as a new flight, 1 - not queued)
+        """
+        updates, appends = self._get_batch_queue()
+        return self._queue_flight(flight, updates, appends)
+
+    def _queue_flight(self, flight: FlightData, updates: list, appends: list) -> int:
+        """
+        This method checks if the flight data should be written and adds it to given lists
+        :param flight: See FlightData class for more information.
+        :param updates: list of flights with lower price, to be updated
+        :param appends: list of new flights, to be appended
+        :return: status code (0 - queued with lower price or as a new flight, 1 - not queued)
+        """
+        self._logger.info(
+            'Queueing flight data: %s->%s with price %s',
+            flight.origin_airport, flight.destination_airport, flight.price
+        )
+
+        flights = self._read_flights(flight.origin_airport)
+        if flights is None:
+            self._logger.error('queue_update: Flights data for `%s` could not be read, not queueing...',
+                               flight.origin_airport)
+            return 1
+        existing_price = flights.get(flight.destination_airport)
 
         # Add new data if there is no data for this destination
-        if row_number == -1:
-            self._logger.debug(f'update_flight: No data for iata code `{flight.destination_airport}`')
-            self._add_flight(flight)
+        if existing_price is None:
+            self._logger.debug('queue_update: No data for iata code `%s`', flight.destination_airport)
+            appends.append(flight)
             return 0
 
-        # Call the Sheets API to update the data
-        sheet_id = self._prepare_sheet_id(flight.origin_airport)
-        update_range = self._prepare_range(sheet_id, f'B{row_number}')
+        # Skip queueing if the price did not change
+        if flight.price == existing_price:
+            self._logger.debug('queue_update: Price unchanged, skipping...')
+            return 1
 
         # Check if price is lower than existing one
-        if flight.price < existing_values[flight.destination_airport]:
-            self._logger.debug(f'update_flight: New price is lower than existing one, updating...')
-            status = self._update_data([[flight.price]], update_range)
+        if flight.price < existing_price:
+            self._logger.debug('queue_update: New price is lower than existing one, queueing...')
+            updates.append(flight)
+            return 0
+
+        self._logger.debug('queue_update: New price is higher than existing one, not queueing...')
+        return 1
+
+    @staticmethod
+    def _lowest_price_flights(flights: list) -> list:
+        """
+        This method keeps only the cheapest flight of every route, so one route is never written twice
+        :param flights: list of FlightData objects
+        :return: list of FlightData objects with the lowest price per start location and destination
+        """
+        lowest = {}
+        for flight in flights:
+            route = (flight.origin_airport, flight.destination_airport)
+            if route not in lowest or flight.price < lowest[route].price:
+                lowest[route] = flight
+        return list(lowest.values())
+
+    def commit_batch(self) -> bool:
+        """
+        This method writes all flights queued by the current thread to the connected Google sheet.
+        If a route was queued more than once, only its cheapest flight is written.
+        :return: True if all queued flights were written, False otherwise
+        """
+        updates, appends = self._get_batch_queue()
+        self.begin_batch()
+
+        with self._write_lock:
+            return not self._write_flights(updates, appends)
+
+    def _write_flights(self, updates: list, appends: list) -> list:
+        """
+        This method writes given flights to the connected Google sheet.
+        Updates are sent in a single batch request and new flights with a single append per sheet.
+        Only the cheapest flight of every route is written, more expensive duplicates are skipped.
+        :param updates: list of flights with lower price, to be updated
+        :param appends: list of new flights, to be appended
+        :return: list of flights which failed to be written, empty if all flights were written
+        """
+        failed = []
+
+        # Same route may be queued more than once, writing it twice would keep the last price or duplicate the row
+        lowest = {id(flight) for flight in self._lowest_price_flights(updates + appends)}
+        updates = [flight for flight in updates if id(flight) in lowest]
+        appends = [flight for flight in appends if id(flight) in lowest]
+
+        self._logger.debug('Committing batch: %s updates, %s new flights', len(updates), len(appends))
+
+        # Find the rows of updated flights, flights without a known row can not be written
+        rows = {}
+        for flight in updates:
+            row_number = self._get_row_number(flight.origin_airport, flight.destination_airport)
+            if row_number == -1:
+                failed.append(flight)
+            else:
+                rows[id(flight)] = row_number
+        updates = [flight for flight in updates if id(flight) in rows]
+
+        # Call the Sheets API to update all existing flights at once
+        if updates:
+            data = [
+                {
+                    'range': self._prepare_range(self._prepare_sheet_id(flight.origin_airport),
+                                                 f'B{rows[id(flight)]}'),
+                    'values': [[flight.price]]
+                }
+                for flight in updates
+            ]
+            if self._batch_update_data(data):
+                for flight in updates:
+                    self._flight_cache[flight.origin_airport][flight.destination_airport] = flight.price
+            else:
+                failed.extend(updates)
+
+        # Group new flights by start location, so every sheet gets a single append
+        grouped_appends = {}
+        for flight in appends:
+            grouped_appends.setdefault(flight.origin_airport, []).append(flight)
+
+        for start_location, flights in grouped_appends.items():
+            if not self._add_flights(start_location, flights):
+                failed.extend(flights)
+
+        if failed:
+            self._logger.error('Batch not fully committed, %s flights not written', len(failed))
         else:
-            self._logger.debug(f'update_flight: New price is higher than existing one, not updating...')
+            self._logger.debug('Batch committed')
+
+        return failed
+
+    def mark_updated(self, start_location: str, destination: str) -> None:
+        """
+        This method stores the time of the last search for given flight
+        :param start_location: start location IATA code
+        :param destination: destination IATA code
+        :return: None
+        """
+        self._last_update_ts[(start_location, destination)] = time.monotonic()
+
+    def is_stale(self, start_location: str, destination: str) -> bool:
+        """
+        This method checks if given flight was not searched for at least MIN_STALE_S seconds
+        :param start_location: start location IATA code
+        :param destination: destination IATA code
+        :return: True if flight should be searched again, False otherwise
+        """
+        last_update = self._last_update_ts.get((start_location, destination))
+        return last_update is None or time.monotonic() - last_update >= DataManager.MIN_STALE_S
 
-        return 0 if status else 1
+    @contextlib.contextmanager
+    def batch(self):
+        """
+        This method returns the context manager for batched flight updates.
+        Flights queued with queue_update inside the block are committed on exit, or discarded if an error occurred.
+        e.g. with manager.batch() as batch: batch.queue_update(flight)
+        :return: context manager yielding the DataManager
+        """
+        # Flights are checked and written under one lock, so the other thread cannot change them in between
+        with self._write_lock:
+            self.begin_batch()
+            try:
+                yield self
+            except Exception:
+                self._logger.debug('Error inside batch, discarding queued flights')
+                self.begin_batch()
+                raise
+            self.commit_batch()
+
+    def update_flights(self, flights: list) -> list:
+        """
+        This method updates many flights in the connected Google sheet with as few requests as possible.
+        Uncached start locations are read with a single batch request and all changes are written in one batch.
+        :param flights: list of FlightData objects
+        :return: list of status codes for given flights (0 - updated with lower price or added,
+        1 - not updated or not written)
+        """
+        # Both threads call this method, so the whole update runs under the lock with its own lists of flights
+        with self._write_lock:
+            # Read all uncached start locations at once
+            start_locations = {flight.origin_airport for flight in flights}
+            self._read_flights_batch(sorted(
+                start_location for start_location in start_locations
+                if not self._is_cached(start_location)
+                and self._check_if_sheet_exists(self._prepare_sheet_id(start_location))
+            ))
+
+            # Searches for different destinations may return the same route, only its cheapest flight is queued
+            lowest = {id(flight) for flight in self._lowest_price_flights(flights)}
+            updates, appends = [], []
+            status_codes = [self._queue_flight(flight, updates, appends) if id(flight) in lowest else 1
+                            for flight in flights]
+            failed = {id(flight) for flight in self._write_flights(updates, appends)}
+
+        # Flights written before a failure keep their status, only the failed ones are reported as not updated
+        return [1 if id(flight) in failed else status_code for flight, status_code in zip(flights, status_codes)]
@@ -1,7 +1,17 @@
 # Copyright (c) 2023 Szymon Kasprzycki
 # This file is protected by MIT license. See LICENSE for more information.
 
+import os
+import json
+import time
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import make_headers
+from urllib3.util.retry import Retry
+from urllib.parse import quote_plus
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from log_module import ProjectLogger
 from datetime import datetime, timedelta
 from flight_data import FlightData
@@ -12,16 +22,84 @@ class FlightSearch:
     This class is responsible for talking to the Flight Search API.
     """
     _MAIN_ENDPOINT = 'https://tequila-api.kiwi.com'
+    _IATA_CACHE_FILE = '.config/iata_cache.json'
+    _RESULT_CACHE_TTL = 600
+    _RESULT_CACHE_SIZE = 256
+    _MAX_WORKERS = 4
+    _LOOKUP_WORKERS = 2
+    _DATE_FMT = '%d/%m/%Y'
+    _SEARCH_WINDOW_DAYS = 7
+    _POOL_SIZE = 32
+    # Minimum time between flight search requests, shared by all workers
+    _MIN_SEARCH_INTERVAL = 0.5
 
     def __init__(self, api_key: str, currency: str):
         self._logger = ProjectLogger().get_module_logger("FlightSearch")
         self._logger.debug('Initializing FlightSearch manager...')
         self.query_endpoint = f'{self._MAIN_ENDPOINT}/locations/query'
         self.search_endpoint = f'{self._MAIN_ENDPOINT}/v2/search'
+        # Constant query parameters are encoded once, only the searched term is filled in per request
+        self._query_url_tmpl = f'{self.query_endpoint}?location_types=airport&limit=1&active_only=true&locale=en-US&term={{}}'
         self._CURRENCY = currency
         self._session = self._setup_session(api_key)
+        self._iata_cache = self._load_iata_cache()
+        # Recently found flights {(fly_from, fly_to, date_from, date_to, curr): (monotonic timestamp, FlightData)}
+        self._result_cache = OrderedDict()
+        self._result_cache_lock = threading.Lock()
+        # Requests are I/O bound, so they run concurrently on a bounded number of workers
+        self._executor = ThreadPoolExecutor(max_workers=self._MAX_WORKERS)
+        # Time the next flight search request may be sent at (monotonic timestamp)
+        self._next_search_ts = 0.0
+        self._search_rate_lock = threading.Lock()
+        # Interactive IATA lookups have their own workers, so they do not wait behind queued flight searches
+        self._lookup_executor = ThreadPoolExecutor(max_workers=self._LOOKUP_WORKERS)
         self._logger.debug('FlightSearch manager initialized.')
 
+    def __enter__(self) -> 'FlightSearch':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """
+        This method saves cached data and closes the HTTP session.
+        :return: None
+        """
+        self.save_iata_cache()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._lookup_executor.shutdown(wait=True, cancel_futures=True)
+        self._session.close()
+        self._logger.debug('FlightSearch manager closed.')
+
+    def _load_iata_cache(self) -> dict:
+        """
+        This method loads IATA codes cached by previous runs.
+        :return: dictionary of cached IATA codes {'city name': 'IATA code'}
+        """
+        if not os.path.exists(self._IATA_CACHE_FILE):
+            return {}
+        try:
+            with open(self._IATA_CACHE_FILE, 'r') as file:
+                cache = {self._iata_key(city): code for city, code in json.load(file).items()}
+            self._logger.debug('%s IATA codes loaded from cache file.', len(cache))
+            return cache
+        except (OSError, json.JSONDecodeError) as e:
+            self._logger.warning('Could not load IATA codes cache. Error message: %s', e)
+            return {}
+
+    def save_iata_cache(self) -> None:
+        """
+        This method saves cached IATA codes, so they can be reused by next runs.
+        :return: None
+        """
+        try:
+            with open(self._IATA_CACHE_FILE, 'w+') as file:
+                json.dump(self._iata_cache, file)
+            self._logger.debug('%s IATA codes saved to cache file.', len(self._iata_cache))
+        except OSError as e:
+            self._logger.error('Could not save IATA codes cache. Error message: %s', e)
+
     def get_data_dict(self, origin_airport: str, destination_airport: str):
         """
         This method returns data dictionary for given airports.
@@ -29,17 +107,16 @@ class FlightSearch:
         :param destination_airport: destination airport (IATA code)
         :return: data dictionary
         """
+        # Read the clock once, so both dates come from the same moment (no race around midnight)
         from_time = datetime.now()
-        to_time = datetime.now() + timedelta(days=7)
-        night_in_dst_from = (to_time - from_time).days
-        night_in_dst_to = night_in_dst_from + 7
+        to_time = from_time + timedelta(days=self._SEARCH_WINDOW_DAYS)
         return {
             'fly_from': origin_airport,
             'fly_to': destination_airport,
-            'date_from': from_time.strftime('%d/%m/%Y'),
-            'date_to': to_time.strftime('%d/%m/%Y'),
-            'nights_in_dst_from': night_in_dst_from,
-            'nights_in_dst_to': night_in_dst_to,
+            'date_from': from_time.strftime(self._DATE_FMT),
+            'date_to': to_time.strftime(self._DATE_FMT),
+            'nights_in_dst_from': self._SEARCH_WINDOW_DAYS,
+            'nights_in_dst_to': self._SEARCH_WINDOW_DAYS * 2,
             'flight_type': 'round',
             'curr': self._CURRENCY,
             'max_stopovers': 0,
@@ -54,6 +131,11 @@ class FlightSearch:
         """
         origin_city = input('What is your origin airport? (eg. Warsaw or WAW or LHR) ')
         destination_city = input('What is your destination city? ')
+        # Missing codes are looked up at the same time, so two cache misses cost one request round trip, not two
+        missing = [city for city in (origin_city, destination_city) if self._iata_key(city) not in self._iata_cache]
+        if len(missing) > 1:
+            list(self._lookup_executor.map(self.get_iata_code, missing))
+        # Codes are now cached (or the single missing one is looked up directly)
         origin_city = self.get_iata_code(origin_city)
         destination_city = self.get_iata_code(destination_city)
         return self.get_data_dict(origin_city, destination_city)
@@ -67,29 +149,53 @@ class FlightSearch:
         session = requests.Session()
         headers = {
             'accept': 'application/json',
+            # Ask for compressed responses, brotli is included if it is installed (same as the requests default)
+            'accept-encoding': make_headers(accept_encoding=True)['accept-encoding'],
             'content-type': 'application/json',
             'apikey': api_key
         }
         session.headers.update(headers)
+        # Keep enough pooled connections for concurrent searches and retry transient errors with backoff.
+        # Retries are not raised as errors, so the last response status reaches raise_for_status().
+        retries = Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 502, 503, 504),
+                        allowed_methods=frozenset({'GET'}), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=self._POOL_SIZE, pool_maxsize=self._POOL_SIZE, max_retries=retries)
+        session.mount('https://', adapter)
         return session
 
+    @staticmethod
+    def _iata_key(city_name: str) -> str:
+        """
+        This method normalizes the city name, so e.g. 'Warsaw' and 'warsaw ' share one IATA cache entry.
+        :param city_name: name of the city
+        :return: IATA cache key
+        """
+        return city_name.strip().casefold()
+
     def get_iata_code(self, city_name: str) -> str:
         """
         This method returns IATA code for given airport (city).
         :param city_name: name of the city
         :return: IATA code
         """
-        self._logger.debug(f'Getting IATA code for {city_name}...')
-        query = {'term': city_name, 'location_types': 'airport', 'limit': 1, 'active_only': 'true', 'locale': 'en-US'}
-        response = self._session.get(url=self.query_endpoint, params=query)
+        city_name = city_name.strip()
+        cache_key = self._iata_key(city_name)
+        if cache_key in self._iata_cache:
+            self._logger.debug('IATA code for %s found in cache.', city_name)
+            return self._iata_cache[cache_key]
+
+        self._logger.debug('Getting IATA code for %s...', city_name)
+        response = self._session.get(url=self._query_url_tmpl.format(quote_plus(city_name)))
         try:
             response.raise_for_status()
         except requests.exceptions.HTTPError as e:
-            self._logger.error(f'Error while getting IATA code for {city_name}.'
-                               f'Error message: {e}')
+            self._logger.error('Error while getting IATA code for %s.'
+                               'Error message: %s', city_name, e)
             raise e
         data = response.json()
-        return data['locations'][0]['code']
+        iata_code = data['locations'][0]['code']
+        self._iata_cache[cache_key] = iata_code
+        return iata_code
 
     def obtain_flight_data(self, query: dict) -> FlightData:
         """
@@ -98,29 +204,91 @@ class FlightSearch:
         :return: flight data - price, origin airport, destination airport, origin city, destination city,
         origin country, destination country, flight link, distance
         """
-        self._logger.debug(f'Obtaining flight data for {query["fly_from"]}->{query["fly_to"]}...')
+        key = (query['fly_from'], query['fly_to'], query['date_from'], query['date_to'], query['curr'])
+        with self._result_cache_lock:
+            cached = self._result_cache.get(key)
+            if cached and time.monotonic() - cached[0] < self._RESULT_CACHE_TTL:
+                self._result_cache.move_to_end(key)
+                self._logger.debug('Flight data for %s->%s found in cache.', query['fly_from'], query['fly_to'])
+                return cached[1]
+
+        flight = self._search_flight(query)
+
+        with self._result_cache_lock:
+            self._result_cache[key] = (time.monotonic(), flight)
+            self._result_cache.move_to_end(key)
+            if len(self._result_cache) > self._RESULT_CACHE_SIZE:
+                self._result_cache.popitem(last=False)
+        return flight
+
+    def _search_flight(self, query: dict) -> FlightData:
+        """
+        This method calls the Flight Search API for given parameters.
+        :param query: flight parameters (see ask_for_flight_data() method)
+        :return: FlightData object or None if no flight was found
+        """
+        self._logger.debug('Obtaining flight data for %s->%s...', query['fly_from'], query['fly_to'])
 
+        self._wait_for_search_slot()
         response = self._session.get(url=self.search_endpoint, params=query)
 
         try:
             response.raise_for_status()
         except requests.exceptions.HTTPError as e:
-            self._logger.error(f'Error while obtaining flight data for {query["fly_from"]}->{query["fly_to"]}.'
-                               f'Error message: {e}')
+            self._logger.error('Error while obtaining flight data for %s->%s.'
+                               'Error message: %s', query['fly_from'], query['fly_to'], e)
             raise e
 
+        # Body is read first, then the raw response tells how many bytes came over the wire before decompression
+        decoded_size = len(response.content)
+        self._logger.debug('Search response: %s bytes received, %s bytes decoded, encoding: %s.',
+                           response.raw.tell(), decoded_size, response.headers.get('content-encoding', 'identity'))
         resp_dict = response.json()
         data = resp_dict['data']
 
         if len(data) == 0:
-            self._logger.warning(f'No flights found for {query["fly_from"]}->{query["fly_to"]}.')
+            self._logger.warning('No flights found for %s->%s.', query['fly_from'], query['fly_to'])
             return None
 
+        # Results are sorted by price, so the first one is the cheapest
+        cheapest = data[0]
         return FlightData(
-            price=data[0]['price'],
-            origin_airport=data[0]['flyFrom'],
-            destination_airport=data[0]['flyTo'],
-            origin_city=data[0]['cityFrom'],
-            destination_city=data[0]['cityTo'],
-            distance=data[0]['distance']
+            price=cheapest['price'],
+            origin_airport=cheapest['flyFrom'],
+            destination_airport=cheapest['flyTo'],
+            origin_city=cheapest['cityFrom'],
+            destination_city=cheapest['cityTo'],
+            distance=cheapest['distance']
         )
+
+    def _wait_for_search_slot(self) -> None:
+        """
+        This method waits until the next flight search request can be sent, so concurrent searches
+        are spread out instead of being sent to the API in bursts.
+        :return: None
+        """
+        with self._search_rate_lock:
+            now = time.monotonic()
+            wait = self._next_search_ts - now
+            # Reserve the slot, so other workers wait for the following ones
+            self._next_search_ts = max(now, self._next_search_ts) + self._MIN_SEARCH_INTERVAL
+        if wait > 0:
+            time.sleep(wait)
+
+    def obtain_flight_data_many(self, queries: list) -> list:
+        """
+        This method returns flight data for many queries, searching for them concurrently.
+        Search requests are sent at most every _MIN_SEARCH_INTERVAL seconds.
+        :param queries: list of flight parameters (see ask_for_flight_data() method)
+        :return: list of results in the order of queries - FlightData object, None if no flight was found
+        or the exception raised by the search
+        """
+        futures = [self._executor.submit(self.obtain_flight_data, query) for query in queries]
+        results = []
+        for query, future in zip(queries, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                self._logger.warning('Search for %s->%s failed: %s', query['fly_from'], query['fly_to'], e)
+                results.append(e)
+        return results
@@ -1,7 +1,11 @@
 # Copyright (c) 2023 Szymon Kasprzycki
 # This file is protected by MIT license. See LICENSE for more information.
 
+import queue
+import atexit
 import logging
+import logging.handlers
+import threading
 
 
 class ProjectLogger:
@@ -14,35 +18,70 @@ class ProjectLogger:
     FILE_HANDLER_LEVEL = logging.DEBUG
     CONSOLE_HANDLER_LEVEL = logging.INFO
     FILE_NAME = 'flights_deal.log'
+    # Handlers are created once and shared by all loggers, so there is a single open log file
+    _HANDLERS = None
+    _HANDLERS_LOCK = threading.Lock()
+    # Records are written to the handlers by a single background listener thread
+    _LISTENER = None
+    _QUEUE_HANDLER = None
 
     @staticmethod
     def _prepare_handlers() -> tuple:
         """
-        This method prepares handlers for the logger.
+        This method prepares handlers for the logger. Handlers are created on first call and reused later.
         """
-        console_handler = logging.StreamHandler()
-        console_handler.setLevel(ProjectLogger.CONSOLE_HANDLER_LEVEL)
-        console_handler.setFormatter(ProjectLogger.FORMATTER)
-        file_handler = logging.FileHandler(ProjectLogger.FILE_NAME, mode='a+')
-        file_handler.setLevel(ProjectLogger.FILE_HANDLER_LEVEL)
-        file_handler.setFormatter(ProjectLogger.FORMATTER)
-        return console_handler, file_handler
+        with ProjectLogger._HANDLERS_LOCK:
+            if ProjectLogger._HANDLERS is None:
+                console_handler = logging.StreamHandler()
+                console_handler.setLevel(ProjectLogger.CONSOLE_HANDLER_LEVEL)
+                console_handler.setFormatter(ProjectLogger.FORMATTER)
+                file_handler = logging.FileHandler(ProjectLogger.FILE_NAME, mode='a+')
+                file_handler.setLevel(ProjectLogger.FILE_HANDLER_LEVEL)
+                file_handler.setFormatter(ProjectLogger.FORMATTER)
+                ProjectLogger._HANDLERS = (console_handler, file_handler)
+            return ProjectLogger._HANDLERS
 
     @staticmethod
     def setup_main_logger() -> logging.Logger:
         """
         This method sets up a logger for the main file. It also clears the log file.
+        Logging threads only put records on a queue, the file is written by a background listener.
         :return: logger object for the main file
         """
         with open(ProjectLogger.FILE_NAME, mode='w+') as file:
             file.write('')
         logger = logging.getLogger(ProjectLogger.PROJECT_NAME)
         logger.setLevel(logging.DEBUG)
-        handlers = ProjectLogger._prepare_handlers()
-        # logger.addHandler(handlers[0]) # uncomment this line to enable console logging
-        logger.addHandler(handlers[1])
+        if ProjectLogger._LISTENER is None:
+            handlers = ProjectLogger._prepare_handlers()
+            log_queue = queue.Queue(-1)
+            # ProjectLogger._LISTENER = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True) # use this line to enable console logging
+            ProjectLogger._LISTENER = logging.handlers.QueueListener(log_queue, handlers[1], respect_handler_level=True)
+            ProjectLogger._LISTENER.start()
+            ProjectLogger._QUEUE_HANDLER = logging.handlers.QueueHandler(log_queue)
+            # Records go to the queue now, so the file handler attached by shutdown() is not needed
+            logger.removeHandler(handlers[1])
+            logger.addHandler(ProjectLogger._QUEUE_HANDLER)
+            # Queued records are written out also if the application exits without calling shutdown()
+            atexit.unregister(ProjectLogger.shutdown)
+            atexit.register(ProjectLogger.shutdown)
         return logger
 
+    @staticmethod
+    def shutdown() -> None:
+        """
+        This method stops the background listener, writing out all queued records.
+        Records logged afterwards are written to the log file directly.
+        :return: None
+        """
+        if ProjectLogger._LISTENER is not None:
+            logger = logging.getLogger(ProjectLogger.PROJECT_NAME)
+            logger.removeHandler(ProjectLogger._QUEUE_HANDLER)
+            logger.addHandler(ProjectLogger._prepare_handlers()[1])
+            ProjectLogger._LISTENER.stop()
+            ProjectLogger._LISTENER = None
+            ProjectLogger._QUEUE_HANDLER = None
+
     @staticmethod
     def get_module_logger(module_name: str = None) -> logging.Logger:
         """
@@ -5,8 +5,9 @@ from app import App
 import threading
 
 if __name__ == '__main__':
-    app = App()
-    thread = threading.Thread(target=app.run)
-    second_thread = threading.Thread(target=app.run_automatic_update)
-    thread.start()
-    second_thread.start()
+    with App() as app:
+        update_thread = threading.Thread(target=app.run_automatic_update)
+        update_thread.start()
+        # Interactive loop runs in the main thread, so it receives KeyboardInterrupt and stops the update thread
+        app.run()
+        update_thread.join()
@@ -1,7 +1,6 @@
 # Copyright (c) 2023 Szymon Kasprzycki
 # This file is protected by MIT license. See LICENSE for more information.
 
-import os
 import json
 from log_module import ProjectLogger
 from twilio.rest import Client as TwilioClient
@@ -22,14 +21,14 @@ class NotificationManager:
         Reads config file.
         :return: dict - config file
         """
-        if not os.path.exists('.config/twilio_config.json'):
-            self._logger.error('Config file not found.')
-            raise FileNotFoundError('Twilio config file not found.')
-        else:
-            self._logger.info('Config file found, reading...')
+        try:
             with open('.config/twilio_config.json', 'r') as file:
+                self._logger.info('Config file found, reading...')
                 config = json.load(file)
                 return config
+        except FileNotFoundError:
+            self._logger.error('Config file not found.')
+            raise FileNotFoundError('Twilio config file not found.') from None
 
     def send_message(self, message: str) -> None:
         """
@@ -54,9 +53,9 @@ class NotificationManager:
         )
 
         if self._check_message_status(message):
-            self._logger.info(f'Message sent: {message.sid}')
+            self._logger.info('Message sent: %s', message.sid)
         else:
-            self._logger.warning(f'Message not sent: {message.sid}')
+            self._logger.warning('Message not sent: %s', message.sid)
 
     def _check_message(self, message: str) -> bool:
         """
@@ -64,7 +63,7 @@ class NotificationManager:
         :param message: str - body of the message
         :return: bool - True if message is valid, False otherwise
         """
-        self._logger.debug(f'Checking message: {message}')
+        self._logger.debug('Checking message: %s', message)
         if len(message) > 1600:
             self._logger.error('Message too long. Max 1600 characters.')
             raise ValueError('Message too long. Max 1600 characters.')
@@ -82,7 +81,7 @@ class NotificationManager:
         :return: bool - True if message was sent, False otherwise
         """
         return_status = False
-        self._logger.debug(f'Checking message status: {message.sid}')
+        self._logger.debug('Checking message status: %s', message.sid)
         if message.status in ('sent', 'delivered', 'sending', 'queued', 'accepted', ):
             self._logger.info('Message delivered.')
             return_status = True